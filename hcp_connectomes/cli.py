@@ -0,0 +1,394 @@
+"""Command line entry point for hcp_connectomes.
+
+Each subcommand imports its processing module (and therefore dipy, nipype,
+ndmg, ...) only when it runs, so ``hcp-connectomes --help`` and
+download-only jobs start without paying for the reconstruction stack.
+"""
+import os
+import subprocess
+import sys
+from argparse import ArgumentParser
+from pathlib import Path
+
+# Modules reported by ``hcp-connectomes import-time`` by default
+SUBSYSTEMS = [
+    "hcp_connectomes.cli",
+    "hcp_connectomes.download",
+    "hcp_connectomes.pipeline",
+    "hcp_connectomes.register",
+    "hcp_connectomes.volumes",
+    "hcp_connectomes.track",
+    "hcp_connectomes.tractogram",
+]
+
+
+def run_download(args):
+    from .download import get_data
+
+    get_data(
+        args.access_key_id,
+        args.secret_access_key,
+        args.output_dir,
+        prefix=args.prefix,
+        n_jobs=args.n_jobs,
+        verbose=args.verbose,
+        endpoint_url=args.endpoint_url,
+    )
+
+
+def run_register(args):
+    from .register import register_t1w_2_mni
+
+    for subject in args.participant_label:
+        register_t1w_2_mni(
+            args.input_dir,
+            args.output_dir,
+            subject,
+            ses=args.session_label,
+            nonlinear=args.nonlinear,
+            vox_size=args.vox,
+            normalize=args.normalize,
+            force=args.force,
+        )
+
+
+def run_volumes(args):
+    from .volumes import compute_all_brain_volumes
+
+    compute_all_brain_volumes(args.input_dir, args.output_dir, args.parcellation_dir)
+
+
+def run_track(args):
+    from .track import run_tractography, save_tracks
+
+    tracks = run_tractography(
+        args.dwi,
+        args.bval,
+        args.bvec,
+        args.wmparc,
+        args.mod_func,
+        args.mod_type,
+        seed_density=args.seed_density,
+    )
+    save_tracks(tracks, args.dwi, args.output)
+
+
+def run_pack(args):
+    import nibabel as nib
+
+    from .tractogram import TractogramWriter
+
+    with TractogramWriter(args.output, args.precision, args.chunk_size) as writer:
+        for trk_file in args.trk_files:
+            # e.g. <subject>_tracks.trk as written by the pipeline
+            subject = Path(trk_file).stem.split("_")[0]
+            if args.verbose:
+                print(f"Packing Subject: {subject}...")
+            trk = nib.streamlines.load(trk_file)
+            # The streamlines are in RAS mm, trk.affine maps voxels to RAS mm
+            writer.add(subject, trk.streamlines, trk.affine)
+
+
+def run_pipeline(args):
+    from .pipeline import print_report, run_pipeline, tractography_stage
+
+    subjects = None
+    if args.participant_file is not None:
+        with open(args.participant_file) as f:
+            subjects = [line.strip() for line in f if line.strip()]
+
+    stages = [
+        (
+            "track",
+            tractography_stage(
+                args.output_dir,
+                mod_func=args.mod_func,
+                mod_type=args.mod_type,
+                seed_density=args.seed_density,
+            ),
+        )
+    ]
+    report = run_pipeline(
+        args.access_key_id,
+        args.secret_access_key,
+        args.scratch_dir,
+        stages,
+        prefix=args.prefix,
+        subjects=subjects,
+        max_staged=args.max_staged,
+        evict=not args.keep_inputs,
+        endpoint_url=args.endpoint_url,
+        verbose=args.verbose,
+    )
+    if not args.verbose:
+        print_report(report)
+
+
+def measure_import_time(module):
+    """Import ``module`` in a fresh interpreter and parse ``-X importtime``.
+
+    Parameters
+    ----------
+    module : str
+        Dotted name of the module to import.
+
+    Returns
+    -------
+    total : int
+        Cumulative import time of ``module`` in microseconds.
+    imports : list of (int, int, str)
+        ``(self_us, cumulative_us, name)`` for every module imported.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    if proc.returncode != 0:
+        raise ImportError(proc.stderr.strip().splitlines()[-1])
+
+    return parse_import_time(proc.stderr, module)
+
+
+def parse_import_time(output, module):
+    """Parses the ``-X importtime`` output of ``import module``.
+
+    See measure_import_time for the return values.
+    """
+    # ``import a.b`` imports ``a`` then ``a.b``, each reported at the top level
+    parts = module.split(".")
+    targets = {".".join(parts[: i + 1]) for i in range(len(parts))}
+
+    total = 0
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        if name.strip() in targets and not name[1:].startswith(" "):
+            total += int(cumulative_us)
+        imports.append((int(self_us), int(cumulative_us), name.strip()))
+
+    return total, imports
+
+
+def run_import_time(args):
+    modules = args.modules or SUBSYSTEMS
+    failed = []
+    for module in modules:
+        try:
+            total, imports = measure_import_time(module)
+        except ImportError as e:
+            print(f"{module}: import failed ({e})")
+            failed.append(module)
+            continue
+
+        print(f"{module}: {total / 1e6:.3f} s")
+        heaviest = sorted(imports, key=lambda x: x[1], reverse=True)
+        # Skip the module itself, which always tops the cumulative list
+        heaviest = [x for x in heaviest if x[2] != module][: args.top]
+        for _, cumulative_us, name in heaviest:
+            print(f"    {cumulative_us / 1e6:8.3f} s  {name}")
+
+        if args.max_seconds is not None and total / 1e6 > args.max_seconds:
+            failed.append(module)
+
+    # Check the budget only once every module has been reported
+    if args.max_seconds is not None and failed:
+        print(
+            f"\n{', '.join(failed)} failed to import or exceeded the "
+            f"{args.max_seconds} s import budget"
+        )
+        sys.exit(1)
+
+
+def str2bool(value):
+    return str(value).lower() in ("true", "1", "yes", "y")
+
+
+def add_s3_arguments(parser):
+    parser.add_argument(
+        "--access_key_id",
+        default=os.environ.get("AWS_ACCESS_KEY_ID"),
+        help="Defaults to the AWS_ACCESS_KEY_ID environment variable.",
+    )
+    parser.add_argument(
+        "--secret_access_key",
+        default=os.environ.get("AWS_SECRET_ACCESS_KEY"),
+        help="Defaults to the AWS_SECRET_ACCESS_KEY environment variable.",
+    )
+    parser.add_argument(
+        "--prefix", default="HCP_1200/", help='One of {"HCP_1200/", "HCP_Retest/"}.'
+    )
+    parser.add_argument(
+        "--endpoint_url",
+        default=None,
+        help="Alternative S3 endpoint, e.g. a local S3 stand-in.",
+    )
+    parser.add_argument("--verbose", action="store_true")
+
+
+def add_track_arguments(parser):
+    parser.add_argument("--mod_func", choices=["csd", "csa"], default="csa")
+    parser.add_argument("--mod_type", choices=["det", "prob"], default="det")
+    parser.add_argument("--seed_density", type=int, default=20)
+
+
+def get_parser():
+    parser = ArgumentParser(
+        prog="hcp-connectomes", description="HCP DWI data preprocessing."
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    # download
+    download = subparsers.add_parser(
+        "download", help="Download T1w and diffusion data from the HCP S3 bucket."
+    )
+    download.add_argument("output_dir", help="Path to the output files.")
+    add_s3_arguments(download)
+    download.add_argument("--n_jobs", type=int, default=1)
+    download.set_defaults(func=run_download)
+
+    # register
+    register = subparsers.add_parser(
+        "register", help="Register T1w images to MNI and segment tissue masks."
+    )
+    register.add_argument(
+        "input_dir",
+        help="The directory with the input dataset"
+        " formatted according to the BIDS standard.",
+    )
+    register.add_argument(
+        "output_dir", help="The directory where the output files should be stored."
+    )
+    register.add_argument(
+        "participant_label",
+        nargs="+",
+        help="The label(s) of the participant(s) that should be analyzed.",
+    )
+    register.add_argument("--session_label", default=1)
+    register.add_argument(
+        "--vox",
+        default="1mm",
+        help="Voxel size : 2mm, 1mm. Voxel size to use for template registrations.",
+    )
+    register.add_argument(
+        "--nonlinear",
+        type=str2bool,
+        default=False,
+        help="Whether to use nonlinear registration",
+    )
+    register.add_argument(
+        "--normalize",
+        type=str2bool,
+        default=True,
+        help="Whether to use T1w normalization",
+    )
+    register.add_argument(
+        "--force",
+        action="store_true",
+        help="Rerun every step, even if its outputs are up to date.",
+    )
+    register.set_defaults(func=run_register)
+
+    # volumes
+    volumes = subparsers.add_parser(
+        "volumes", help="Compute per-ROI brain volumes from registered tissue masks."
+    )
+    volumes.add_argument("input_dir", help="The output directory of `register`.")
+    volumes.add_argument("output_dir", help="Where the csv files are written.")
+    volumes.add_argument(
+        "parcellation_dir", help="The neuroparc directory containing parcellations."
+    )
+    volumes.set_defaults(func=run_volumes)
+
+    # track
+    track = subparsers.add_parser("track", help="Run local tractography.")
+    track.add_argument("dwi")
+    track.add_argument("bval")
+    track.add_argument("bvec")
+    track.add_argument("wmparc")
+    track.add_argument("output", help="Output tractogram, e.g. tracks.trk")
+    add_track_arguments(track)
+    track.set_defaults(func=run_track)
+
+    # pipeline
+    pipeline = subparsers.add_parser(
+        "pipeline",
+        help="Download and process subjects one at a time with bounded scratch disk.",
+    )
+    pipeline.add_argument("scratch_dir", help="Where raw subject data is staged.")
+    pipeline.add_argument("output_dir", help="Where the tractograms are written.")
+    add_s3_arguments(pipeline)
+    pipeline.add_argument(
+        "--participant_file",
+        default=None,
+        help="File with one subject id per line. Defaults to every subject.",
+    )
+    pipeline.add_argument(
+        "--max_staged",
+        type=int,
+        default=2,
+        help="Maximum number of subjects on the scratch disk at once.",
+    )
+    pipeline.add_argument(
+        "--keep_inputs",
+        action="store_true",
+        help="Do not remove raw subject data after processing.",
+    )
+    add_track_arguments(pipeline)
+    pipeline.set_defaults(func=run_pipeline)
+
+    # pack
+    pack = subparsers.add_parser(
+        "pack", help="Pack per-subject .trk files into one compact tractogram store."
+    )
+    pack.add_argument("output", help="Output file, e.g. cohort.htrk")
+    pack.add_argument(
+        "trk_files", nargs="+", help="Files named <subject>_*.trk or <subject>.trk"
+    )
+    pack.add_argument(
+        "--precision",
+        type=float,
+        default=0.01,
+        help="Quantization step of the coordinates, in mm.",
+    )
+    pack.add_argument(
+        "--chunk_size", type=int, default=2000, help="Streamlines per chunk."
+    )
+    pack.add_argument("--verbose", action="store_true")
+    pack.set_defaults(func=run_pack)
+
+    # import-time
+    import_time = subparsers.add_parser(
+        "import-time", help="Report the import time of each subsystem."
+    )
+    import_time.add_argument(
+        "modules",
+        nargs="*",
+        help="Modules to measure. Defaults to every hcp_connectomes subsystem.",
+    )
+    import_time.add_argument(
+        "--top", type=int, default=5, help="Number of heaviest imports to list."
+    )
+    import_time.add_argument(
+        "--max_seconds",
+        type=float,
+        default=None,
+        help="Exit with status 1 if any module fails to import or takes longer "
+        "than this to import.",
+    )
+    import_time.set_defaults(func=run_import_time)
+
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
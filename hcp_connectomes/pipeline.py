@@ -0,0 +1,318 @@
+"""Overlapped download -> process -> evict pipeline.
+
+Subjects are downloaded one at a time into a scratch directory and handed to
+a chain of processing stages, each running in its own thread. At most
+``max_staged`` subjects are on disk at once; the raw inputs of a subject are
+removed once its last stage has finished, so the cohort can be processed
+with a bounded amount of scratch space.
+"""
+import queue
+import shutil
+import threading
+import time
+from pathlib import Path
+
+from .download import download_subject, get_client, get_subjects
+
+_DONE = object()
+
+
+class StageStats:
+    """Timing and queue depth bookkeeping for a single pipeline stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.busy = 0.0
+        self.idle = 0.0
+        self.n_subjects = 0
+        self.n_failed = 0
+        self.depths = []
+
+    def summary(self):
+        return dict(
+            name=self.name,
+            busy=self.busy,
+            idle=self.idle,
+            n_subjects=self.n_subjects,
+            n_failed=self.n_failed,
+            max_queue_depth=max(self.depths, default=0),
+            mean_queue_depth=sum(self.depths) / len(self.depths) if self.depths else 0,
+        )
+
+
+def _run_stage(name, func, in_q, out_q, stats, verbose, stop, errors):
+    try:
+        _process(name, func, in_q, out_q, stats, verbose, stop)
+    except BaseException as e:
+        # Record the error before the downstream stages can finish
+        errors.append(e)
+        stop.set()
+    finally:
+        out_q.put(_DONE)
+
+
+def _process(name, func, in_q, out_q, stats, verbose, stop):
+    while True:
+        stats.depths.append(in_q.qsize())
+        start = time.perf_counter()
+        item = in_q.get()
+        stats.idle += time.perf_counter() - start
+
+        if item is _DONE:
+            break
+
+        sub_id, subject_path, failed = item
+        # After a fatal error, pass subjects through unprocessed to be evicted
+        if not failed and not stop.is_set():
+            if verbose:
+                print(f"Running {name} on Subject: {sub_id}...")
+            start = time.perf_counter()
+            try:
+                func(sub_id, subject_path)
+            except Exception as e:
+                print(f"{name} failed on Subject {sub_id}: {e!r}")
+                failed = True
+                stats.n_failed += 1
+            stats.busy += time.perf_counter() - start
+            stats.n_subjects += 1
+
+        out_q.put((sub_id, subject_path, failed))
+
+
+def run_pipeline(
+    access_key_id,
+    secret_access_key,
+    scratch_path,
+    stages,
+    prefix="HCP_1200/",
+    subjects=None,
+    max_staged=2,
+    evict=True,
+    endpoint_url=None,
+    s3=None,
+    verbose=False,
+):
+    """
+    Downloads and processes subjects with downloading overlapped with processing.
+
+    Parameters
+    ----------
+    access_key_id : str
+
+    secret_access_key : str
+
+    scratch_path : str
+        Directory the raw subject data is downloaded to.
+
+    stages : list of (str, callable)
+        Processing stages, run in order on each subject. Each callable is
+        called as ``func(subject, subject_path)`` where ``subject_path`` is the
+        downloaded subject directory, and must write its own outputs outside of
+        ``scratch_path``. An exception marks the subject as failed and skips the
+        remaining stages for it. Exceptions that do not derive from Exception,
+        e.g. SystemExit, stop the pipeline: the running stages finish their
+        current subject, the staged subjects are evicted (if ``evict``) and
+        the exception is raised by run_pipeline.
+
+    prefix : str
+        One of {"HCP_1200/", "HCP_Retest/"}
+
+    subjects : list of str, optional
+        Subject ids to process. Defaults to every subject under ``prefix``.
+
+    max_staged : int, default=2
+        Maximum number of subjects on disk at once. With 2, subject N+1 is
+        downloaded while subject N is processed.
+
+    evict : bool, default=True
+        Whether to remove the raw subject data after the last stage.
+
+    endpoint_url : str, optional
+        Alternative S3 endpoint, e.g. a local S3 stand-in.
+
+    s3 : boto3 S3 client, optional
+        Client to download with. Overrides the credentials and ``endpoint_url``.
+
+    verbose : bool, default=False
+
+    Returns
+    -------
+    dict
+        ``"subjects"`` maps each subject id to one of {"done", "failed",
+        "missing"}. "failed" subjects had a failed download or stage and can be
+        retried, "missing" ones lack the required files in the bucket.
+        ``"stages"`` holds a :meth:`StageStats.summary` for the
+        download stage followed by every processing stage, and ``"wall_time"``
+        is the total run time in seconds.
+    """
+    if max_staged < 1:
+        raise ValueError("max_staged must be at least 1.")
+
+    if s3 is None:
+        s3 = get_client(access_key_id, secret_access_key, endpoint_url)
+    if subjects is None:
+        subject_list = list(get_subjects(s3, prefix))
+    else:
+        subject_list = [f"{prefix}{subject}/" for subject in subjects]
+
+    scratch_path = Path(scratch_path)
+    slots = threading.Semaphore(max_staged)
+    queues = [queue.Queue() for _ in range(len(stages) + 1)]
+    results = {}
+
+    download_stats = StageStats("download")
+
+    stop = threading.Event()
+    errors = []
+    # Subjects on the scratch disk
+    staged = {}
+
+    def download():
+        try:
+            fetch()
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            queues[0].put(_DONE)
+
+    def fetch():
+        for sub_prefix in subject_list:
+            sub_id = sub_prefix.split("/")[1]
+
+            # Waiting here means processing is the bottleneck
+            start = time.perf_counter()
+            while not slots.acquire(timeout=0.1):
+                if stop.is_set():
+                    return
+            if stop.is_set():
+                return
+            download_stats.idle += time.perf_counter() - start
+            download_stats.depths.append(queues[0].qsize())
+
+            start = time.perf_counter()
+            try:
+                files = download_subject(
+                    s3, sub_prefix, scratch_path, prefix, verbose=verbose
+                )
+            except Exception as e:
+                print(f"download failed on Subject {sub_id}: {e!r}")
+                files = []
+                download_stats.n_failed += 1
+                # Unlike a subject missing from the bucket, this can be retried
+                results[sub_id] = "failed"
+            download_stats.busy += time.perf_counter() - start
+            download_stats.n_subjects += 1
+
+            subject_path = scratch_path / sub_id
+            staged[sub_id] = subject_path
+            if not files:
+                results.setdefault(sub_id, "missing")
+                shutil.rmtree(subject_path, ignore_errors=True)
+                del staged[sub_id]
+                slots.release()
+                continue
+
+            queues[0].put((sub_id, subject_path, False))
+
+    stage_stats = [StageStats(name) for name, _ in stages]
+    threads = [threading.Thread(target=download, daemon=True)]
+    for (name, func), in_q, out_q, stats in zip(
+        stages, queues[:-1], queues[1:], stage_stats
+    ):
+        threads.append(
+            threading.Thread(
+                target=_run_stage,
+                args=(name, func, in_q, out_q, stats, verbose, stop, errors),
+                daemon=True,
+            )
+        )
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+
+    while True:
+        item = queues[-1].get()
+        if item is _DONE:
+            break
+
+        sub_id, subject_path, failed = item
+        if not stop.is_set():
+            results[sub_id] = "failed" if failed else "done"
+        if evict:
+            if verbose:
+                print(f"Evicting Subject: {sub_id}...")
+            shutil.rmtree(subject_path, ignore_errors=True)
+        staged.pop(sub_id, None)
+        slots.release()
+
+    # The download loop stops on the event, and the stages stop once their
+    # current subject is done, so every thread can be joined
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        # Subjects held by the stage that died never reach the end of the chain
+        if evict:
+            for subject_path in staged.values():
+                shutil.rmtree(subject_path, ignore_errors=True)
+        raise errors[0]
+
+    wall_time = time.perf_counter() - start
+
+    report = dict(
+        subjects=results,
+        stages=[s.summary() for s in [download_stats] + stage_stats],
+        wall_time=wall_time,
+    )
+    if verbose:
+        print_report(report)
+
+    return report
+
+
+def print_report(report):
+    """Prints the per-stage busy/idle times and queue depths of a pipeline run."""
+    print(f"\nPipeline finished in {report['wall_time']:.1f} s")
+    print(
+        f"{'stage':<16}{'subjects':>9}{'failed':>8}{'busy [s]':>11}"
+        f"{'idle [s]':>11}{'max queue':>11}{'mean queue':>12}"
+    )
+    for s in report["stages"]:
+        print(
+            f"{s['name']:<16}{s['n_subjects']:>9}{s['n_failed']:>8}"
+            f"{s['busy']:>11.1f}{s['idle']:>11.1f}"
+            f"{s['max_queue_depth']:>11}{s['mean_queue_depth']:>12.2f}"
+        )
+
+
+def tractography_stage(output_path, mod_func="csa", mod_type="det", seed_density=20):
+    """
+    Returns a pipeline stage running run_tractography on the raw HCP diffusion
+    data and saving ``<output_path>/<subject>/<subject>_tracks.trk``.
+    """
+    output_path = Path(output_path)
+
+    def stage(subject, subject_path):
+        from .track import run_tractography, save_tracks
+
+        diffusion_path = subject_path / "T1w" / "Diffusion"
+        fdwi = str(diffusion_path / "data.nii.gz")
+        tracks = run_tractography(
+            fdwi,
+            str(diffusion_path / "bvals"),
+            str(diffusion_path / "bvecs"),
+            str(subject_path / "T1w" / "wmparc.nii.gz"),
+            mod_func,
+            mod_type,
+            seed_density=seed_density,
+        )
+
+        out_dir = output_path / subject
+        if not out_dir.is_dir():
+            out_dir.mkdir(parents=True)
+        save_tracks(tracks, fdwi, out_dir / f"{subject}_tracks.trk")
+
+    return stage
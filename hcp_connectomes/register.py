@@ -0,0 +1,291 @@
+import os
+import warnings
+from functools import partial
+from pathlib import Path
+
+import nibabel as nib
+
+from .steps import StepRunner
+
+
+def match_target_vox_res(img_file, vox_size="1mm", sens="t1w"):
+    """Reslices input MRI file if it does not match the targeted voxel resolution. Can take dwi or t1w scans.
+    
+    Parameters
+    ----------
+    img_file : str
+        path to file to be resliced
+    vox_size : str
+        target voxel resolution ('2mm' or '1mm')
+    namer : name_resource
+        name_resource variable containing relevant directory tree information
+    sens : str
+        type of data being analyzed ('dwi' or 'func')
+    
+    Returns
+    -------
+    str
+        location of potentially resliced image
+    """
+    from dipy.align.reslice import reslice
+
+    # Check dimensions
+    img = nib.load(img_file)
+    data = img.get_fdata()
+    affine = img.affine
+    hdr = img.header
+    zooms = hdr.get_zooms()[:3]
+    if vox_size == "1mm":
+        new_zooms = (1.0, 1.0, 1.0)
+    elif vox_size == "2mm":
+        new_zooms = (2.0, 2.0, 2.0)
+
+    if (abs(zooms[0]), abs(zooms[1]), abs(zooms[2])) != new_zooms:
+        # print("Reslicing image " + img_file + " to " + vox_size + "...")
+
+        data2, affine2 = reslice(data, affine, zooms, new_zooms)
+        img2 = nib.Nifti1Image(data2, affine=affine2)
+        nib.save(img2, img_file)
+    else:
+        nib.save(img, img_file)
+
+
+def register_t1w_2_mni(
+    input_path,
+    output_path,
+    subject,
+    ses=1,
+    nonlinear=False,
+    vox_size="1mm",
+    normalize=True,
+    force=False,
+):
+    """
+    Steps whose outputs are newer than their inputs are skipped, so an
+    interrupted run resumes at the step that failed.
+
+    Parameters
+    ----------
+    input_path : str
+        directory to bids
+    output_path : str
+        output bids
+    force : bool, default=False
+        Rerun every step, even if its outputs are up to date
+    """
+    # ndmg pulls in sklearn, which emits DeprecationWarnings on import
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", category=DeprecationWarning)
+        from ndmg.utils import reg_utils as mgru
+
+    # deal with paths
+    input_path = Path(input_path)
+    output_path = Path(output_path) / f"sub-{subject}"
+
+    if not (input_path / f"sub-{subject}").is_dir():
+        return
+
+    if not output_path.is_dir():
+        output_path.mkdir(parents=True)
+
+    mask_path = output_path / "masks"
+    if not mask_path.is_dir():
+        mask_path.mkdir(parents=True)
+
+    FSLDIR = os.environ["FSLDIR"]
+
+    # files names
+    input_t1w = (
+        input_path
+        / f"sub-{subject}"
+        / f"ses-{ses}"
+        / "anat"
+        / f"sub-{subject}_ses-{ses}_T1w.nii.gz"
+    )
+    input_mni = "%s%s%s%s" % (
+        FSLDIR,
+        "/data/standard/MNI152_T1_",
+        vox_size,
+        "_brain.nii.gz",
+    )
+    input_mni_mask = "%s%s%s%s" % (
+        FSLDIR,
+        "/data/standard/MNI152_T1_",
+        vox_size,
+        "_brain_mask.nii.gz",
+    )
+    input_mni_sched = "%s%s" % (FSLDIR, "/etc/flirtsch/T1_2_MNI152_2mm.cnf")
+
+    t1w_brain = output_path / f"sub-{subject}_ses-{ses}_T1w_brain.nii.gz"
+    t1w_normalized = output_path / f"sub-{subject}_ses-{ses}_T1w_normalized.nii.gz"
+    t1w_brain_aligned = (
+        output_path / f"sub-{subject}_ses-{ses}_T1w_brain_aligned.nii.gz"
+    )
+    t12mni_xfm_init = output_path / f"sub-{subject}_ses-{ses}_t12mni_xfm_init.mat"
+    t12mni_xfm = output_path / f"sub-{subject}_ses-{ses}_t12mni_xfm.mat"
+    # FNIRT writes its coefficient field as an image, appending .nii.gz otherwise
+    warp_t1w2mni = output_path / f"sub-{subject}_ses-{ses}_warp-t1w2mni.nii.gz"
+
+    runner = StepRunner(output_path / f"sub-{subject}_ses-{ses}_steps.json", force)
+
+    if normalize:
+        # Normalize
+        print("\nRunning Normalization")
+        runner.run(
+            "normalize",
+            lambda: mgru.normalize_t1w(input_t1w, t1w_normalized),
+            inputs=[input_t1w],
+            outputs=[t1w_normalized],
+        )
+    else:
+        t1w_normalized = input_t1w
+
+    # Skull stripping and voxel reshape. The reshape rewrites t1w_brain in
+    # place, so both are a single step.
+    def skullstrip():
+        print("\nRunning 3dSkullStrip")
+        mgru.t1w_skullstrip(t1w_normalized, str(t1w_brain))
+
+        print("\nRunning Voxel Matching")
+        match_target_vox_res(str(t1w_brain))
+
+    runner.run(
+        "skullstrip",
+        skullstrip,
+        inputs=[t1w_normalized],
+        outputs=[t1w_brain],
+        params=dict(normalize=normalize),
+    )
+
+    # Create linear transform/ initializer T1w-->MNI
+    print("\nInitial T1w->MNI transform")
+    runner.run(
+        "initial_xfm",
+        lambda: mgru.align(
+            t1w_brain,
+            input_mni,
+            xfm=t12mni_xfm_init,
+            bins=None,
+            interp="spline",
+            out=None,
+            dof=12,
+            cost="mutualinfo",
+            searchrad=True,
+        ),
+        inputs=[t1w_brain, input_mni],
+        outputs=[t12mni_xfm_init],
+        params=dict(vox_size=vox_size),
+    )
+
+    # Registration from t1w -> MNI
+    if nonlinear:
+        print("\nRunning non-linear registration: T1w-->MNI ...")
+        # Use FNIRT to nonlinearly align T1 to MNI template
+        runner.run(
+            "register",
+            lambda: mgru.align_nonlinear(
+                t1w_brain,
+                input_mni,
+                xfm=t12mni_xfm_init,
+                out=t1w_brain_aligned,
+                warp=warp_t1w2mni,
+                ref_mask=input_mni_mask,
+                config=input_mni_sched,
+            ),
+            inputs=[t1w_brain, input_mni, input_mni_mask, t12mni_xfm_init],
+            outputs=[t1w_brain_aligned, warp_t1w2mni],
+            params=dict(nonlinear=nonlinear, vox_size=vox_size),
+        )
+    else:
+        # Falling back to linear registration
+        print("\nRunning linear registration: T1w-->MNI ...")
+        runner.run(
+            "register",
+            lambda: mgru.align(
+                t1w_brain,
+                input_mni,
+                xfm=t12mni_xfm,
+                init=t12mni_xfm_init,
+                bins=None,
+                dof=12,
+                cost="mutualinfo",
+                searchrad=True,
+                interp="spline",
+                out=t1w_brain_aligned,
+                sch=None,
+            ),
+            inputs=[t1w_brain, input_mni, t12mni_xfm_init],
+            outputs=[t1w_brain_aligned, t12mni_xfm],
+            params=dict(nonlinear=nonlinear, vox_size=vox_size),
+        )
+
+    # Segment wm, gm, csf. FAST names its outputs after the basename.
+    seg_basename = mask_path / f"sub-{subject}"
+    wm_mask = f"{seg_basename}_pve_2.nii.gz"
+    gm_mask = f"{seg_basename}_pve_1.nii.gz"
+    csf_mask = f"{seg_basename}_pve_0.nii.gz"
+    tissue_mask = f"{seg_basename}_pveseg.nii.gz"
+
+    def segment():
+        print("\nSegmenting brain regions")
+        maps = mgru.segment_t1w(t1w_brain, seg_basename)
+        for mask in [maps["wm_prob"], maps["gm_prob"], maps["csf_prob"], tissue_mask]:
+            match_target_vox_res(mask)
+
+    runner.run(
+        "segment",
+        segment,
+        inputs=[t1w_brain],
+        outputs=[wm_mask, gm_mask, csf_mask, tissue_mask],
+    )
+
+    # Apply xfm to masks
+    wm_mask_aligned = mask_path / f"sub-{subject}_wm_mask.nii.gz"
+    gm_mask_aligned = mask_path / f"sub-{subject}_gm_mask.nii.gz"
+    csf_mask_aligned = mask_path / f"sub-{subject}_csf_mask.nii.gz"
+    tissue_mask_aligned = mask_path / f"sub-{subject}_tissue_mask.nii.gz"
+
+    print("\nApplying T1w-->MNI warp to masks")
+    for tissue, mask, mask_aligned in [
+        ("wm", wm_mask, wm_mask_aligned),
+        ("gm", gm_mask, gm_mask_aligned),
+        ("csf", csf_mask, csf_mask_aligned),
+        ("tissue", tissue_mask, tissue_mask_aligned),
+    ]:
+        # partial binds this iteration's paths, the runner may call it later
+        if nonlinear:
+            # The warp already includes the initial affine
+            runner.run(
+                f"applyxfm_{tissue}",
+                partial(
+                    mgru.apply_warp,
+                    str(t1w_brain_aligned),
+                    mask,
+                    str(mask_aligned),
+                    str(warp_t1w2mni),
+                ),
+                inputs=[t1w_brain_aligned, mask, warp_t1w2mni],
+                outputs=[mask_aligned],
+                params=dict(nonlinear=nonlinear),
+            )
+        else:
+            runner.run(
+                f"applyxfm_{tissue}",
+                partial(
+                    mgru.applyxfm,
+                    str(t1w_brain_aligned),
+                    mask,
+                    str(t12mni_xfm),
+                    str(mask_aligned),
+                ),
+                inputs=[t1w_brain_aligned, mask, t12mni_xfm],
+                outputs=[mask_aligned],
+                params=dict(nonlinear=nonlinear),
+            )
+
+    # remove unnecessary files
+    runner.cleanup(
+        [x for x in mask_path.glob("*.nii.gz") if not "mask" in str(x.name)]
+    )
+
+    runner.print_timings()
@@ -0,0 +1,172 @@
+"""Dependency tracked step runner with checkpointing.
+
+Each step declares its input and output files and the parameters it was run
+with. A step is skipped when all of its outputs are newer than all of its
+inputs and its parameters are unchanged, so an interrupted run resumes at the
+step that failed. The state is kept in a json file next to the outputs.
+"""
+import json
+import os
+import time
+from pathlib import Path
+
+
+class StepRunner:
+    """
+    Parameters
+    ----------
+    state_file : str
+        Path to the json file the step state is stored in.
+
+    force : bool, default=False
+        Whether to rerun every step regardless of the stored state.
+
+    verbose : bool, default=True
+    """
+
+    def __init__(self, state_file, force=False, verbose=True):
+        self.state_file = Path(state_file)
+        self.force = force
+        self.verbose = verbose
+        self.timings = []
+        # Steps declared during this run, so removed files can be remade
+        self._steps = {}
+
+        if self.state_file.is_file():
+            with open(self.state_file) as f:
+                self.state = json.load(f)
+        else:
+            self.state = dict(steps={}, removed={})
+
+    def _save(self):
+        tmp_file = self.state_file.with_name(self.state_file.name + ".tmp")
+        with open(tmp_file, "w") as f:
+            json.dump(self.state, f, indent=2, sort_keys=True)
+        os.replace(tmp_file, self.state_file)
+
+    def _mtime(self, path):
+        """mtime of ``path``, or of its last version if removed by cleanup."""
+        try:
+            return os.stat(path).st_mtime
+        except FileNotFoundError:
+            return self.state["removed"].get(str(path))
+
+    def is_current(self, name, inputs, outputs, params):
+        """Whether step ``name`` is up to date and can be skipped."""
+        step = self.state["steps"].get(name)
+        if self.force or step is None or step["params"] != params:
+            return False
+
+        input_mtimes = [self._mtime(x) for x in inputs]
+        output_mtimes = [self._mtime(x) for x in outputs]
+        if None in input_mtimes or None in output_mtimes:
+            return False
+
+        return max(input_mtimes, default=0) <= min(output_mtimes, default=0)
+
+    def run(self, name, func, inputs=(), outputs=(), params=None):
+        """
+        Runs ``func()`` unless step ``name`` is up to date.
+
+        Parameters
+        ----------
+        name : str
+            Unique name of the step.
+
+        func : callable
+            Called without arguments. Must create every file in ``outputs``,
+            which are removed before it is called.
+
+        inputs : list of str or Path
+            Files the step reads.
+
+        outputs : list of str or Path
+            Files the step writes.
+
+        params : dict, optional
+            Json serializable parameters. The step reruns when they change.
+
+        Returns
+        -------
+        bool
+            True if the step was run, False if it was skipped.
+        """
+        # Round trip through json so that e.g. tuples compare equal to the state
+        params = json.loads(json.dumps(params or {}, default=str))
+        self._steps[name] = (func, inputs, outputs, params)
+
+        if self.is_current(name, inputs, outputs, params):
+            if self.verbose:
+                print(f"\nSkipping {name}: outputs are up to date")
+            self.timings.append((name, 0.0, False))
+            return False
+
+        self._execute(name, func, inputs, outputs, params)
+        return True
+
+    def _restore(self, inputs):
+        """Reruns the steps that made any of ``inputs`` removed by cleanup."""
+        for x in inputs:
+            if Path(x).exists() or str(x) not in self.state["removed"]:
+                continue
+
+            producer = None
+            for name, (_, _, outputs, _) in self._steps.items():
+                if str(x) in [str(y) for y in outputs]:
+                    producer = name
+            if producer is None:
+                raise RuntimeError(f"{x} was removed and no step produces it")
+
+            if self.verbose:
+                print(f"\nRerunning {producer} to restore {x}")
+            self._execute(producer, *self._steps[producer])
+
+    def _execute(self, name, func, inputs, outputs, params):
+        self._restore(inputs)
+
+        # Drop the step so that a failure below is never recorded as done
+        self.state["steps"].pop(name, None)
+        self._save()
+
+        # The tools wrapped by steps often fail without raising, so remove
+        # stale outputs to make sure the ones checked below are new
+        for x in outputs:
+            if Path(x).exists():
+                Path(x).unlink()
+
+        start = time.perf_counter()
+        func()
+        duration = time.perf_counter() - start
+
+        missing = [str(x) for x in outputs if not Path(x).exists()]
+        if missing:
+            raise RuntimeError(f"Step {name} did not produce {', '.join(missing)}")
+
+        for x in outputs:
+            self.state["removed"].pop(str(x), None)
+        self.state["steps"][name] = dict(params=params, duration=duration)
+        self._save()
+
+        self.timings.append((name, duration, True))
+
+    def cleanup(self, paths):
+        """
+        Removes intermediate files without invalidating the steps that made them.
+
+        The mtimes of the removed files are kept in the state, so steps that
+        produced or read them stay up to date on the next run. If a step that
+        reads a removed file has to rerun, the step that made it is rerun first.
+        """
+        for path in paths:
+            path = Path(path)
+            if not path.exists():
+                continue
+            self.state["removed"][str(path)] = path.stat().st_mtime
+            path.unlink()
+        self._save()
+
+    def print_timings(self):
+        print("\nStep timings")
+        for name, duration, ran in self.timings:
+            status = f"{duration:8.1f} s" if ran else "  skipped"
+            print(f"    {status}  {name}")
@@ -5,6 +5,8 @@ from dipy.core.gradients import gradient_table
 from dipy.data import get_sphere
 from dipy.direction import ProbabilisticDirectionGetter, peaks_from_model
 from dipy.io.gradients import read_bvals_bvecs
+from dipy.io.stateful_tractogram import Space, StatefulTractogram
+from dipy.io.streamline import save_tractogram
 from dipy.reconst.csdeconv import ConstrainedSphericalDeconvModel, recursive_response
 from dipy.reconst.shm import CsaOdfModel
 from dipy.tracking import utils
@@ -152,3 +154,20 @@ def run_tractography(fdwi, fbval, fbvec, fwmparc, mod_func, mod_type, seed_densi
     streamlines = Streamlines(streamline_generator)
     tracks = Streamlines([track for track in streamlines if len(track) > 60])
     return tracks
+
+
+def save_tracks(tracks, fdwi, out_file):
+    """Saves the output of run_tractography, e.g. as a .trk file.
+
+    Parameters
+    ----------
+    tracks : Streamlines
+        Streamlines in voxel coordinates, as returned by run_tractography
+    fdwi : str
+        Path to the dwi the streamlines were tracked on
+    out_file : str
+        Path to the output tractogram
+    """
+    # run_tractography tracks with an identity affine, i.e. in voxel space
+    sft = StatefulTractogram(tracks, fdwi, Space.VOX)
+    save_tractogram(sft, str(out_file), bbox_valid_check=False)
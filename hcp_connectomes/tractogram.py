@@ -0,0 +1,369 @@
+"""Compact chunked storage for cohort tractograms.
+
+Coordinates are quantized to a fixed ``precision`` and delta encoded along the
+concatenated points, so consecutive points of a streamline (0.5 apart for
+run_tractography) fit in int16. The jumps between streamlines are kept
+separately as int32. Each chunk of streamlines is byte shuffled and zlib
+compressed on its own.
+
+File layout::
+
+    MAGIC | chunk 0 | chunk 1 | ... | json index | uint64 index offset | MAGIC
+
+Chunks also store the arc length of every streamline. The index holds, for
+every chunk, its subject, byte offset, number of streamlines, streamline
+length range and endpoint bounding box, so subsets can be read without
+decompressing the whole file.
+"""
+import json
+import os
+import struct
+import zlib
+
+import numpy as np
+from nibabel.streamlines import ArraySequence
+
+MAGIC = b"HCPTRK01"
+_FOOTER = struct.Struct("<Q")
+
+
+def _shuffle(arr):
+    """Groups the i-th bytes of every element together, which compresses better."""
+    return arr.view(np.uint8).reshape(-1, arr.itemsize).T.tobytes()
+
+
+def _unshuffle(buf, dtype, count):
+    dtype = np.dtype(dtype)
+    arr = np.frombuffer(buf, dtype=np.uint8).reshape(dtype.itemsize, count)
+    return np.ascontiguousarray(arr.T).view(dtype).ravel()
+
+
+def _encode(points, n_points, lengths, precision, level):
+    quantized = np.round(points / precision).astype(np.int32)
+    deltas = np.diff(quantized, axis=0, prepend=np.zeros((1, 3), np.int32))
+
+    starts = np.concatenate([[0], np.cumsum(n_points)[:-1]])
+    jumps = deltas[starts].copy()
+    deltas[starts] = 0
+
+    if np.abs(deltas).max() <= np.iinfo(np.int16).max:
+        deltas = deltas.astype(np.int16)
+
+    payload = b"".join(
+        [
+            n_points.astype(np.uint32).tobytes(),
+            lengths.astype(np.float32).tobytes(),
+            jumps.astype(np.int32).tobytes(),
+            # Store x, y and z deltas contiguously
+            _shuffle(np.ascontiguousarray(deltas.T)),
+        ]
+    )
+    return zlib.compress(payload, level), deltas.dtype.name
+
+
+def _decode(buf, n_streamlines, n_points, delta_dtype, precision):
+    payload = zlib.decompress(buf)
+
+    sections = np.cumsum([0, 4, 4, 12]) * n_streamlines
+    counts = np.frombuffer(payload[: sections[1]], np.uint32).astype(np.intp)
+    lengths = np.frombuffer(payload[sections[1] : sections[2]], np.float32)
+    jumps = np.frombuffer(payload[sections[2] : sections[3]], np.int32)
+    deltas = _unshuffle(payload[sections[3] :], delta_dtype, 3 * n_points)
+
+    deltas = deltas.reshape(3, n_points).T.astype(np.int32)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    deltas[starts] = jumps.reshape(-1, 3)
+
+    points = np.cumsum(deltas, axis=0, dtype=np.int32) * precision
+    return points.astype(np.float32), counts, lengths
+
+
+class TractogramWriter:
+    """
+    Writes streamlines of many subjects to a single compact file.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the output file.
+
+    precision : float, default=0.01
+        Quantization step of the coordinates, in the units of the
+        streamlines. The maximum error of every coordinate is precision / 2.
+
+    chunk_size : int, default=2000
+        Maximum number of streamlines per compressed chunk. Smaller chunks
+        allow finer grained subset reads at a small cost in compression.
+
+    compression_level : int, default=6
+        zlib compression level.
+
+    Examples
+    --------
+    >>> with TractogramWriter("cohort.htrk") as writer:
+    ...     writer.add("100206", tracks, affine)
+    """
+
+    def __init__(
+        self, filename, precision=0.01, chunk_size=2000, compression_level=6
+    ):
+        self.filename = filename
+        self.precision = precision
+        self.chunk_size = chunk_size
+        self.compression_level = compression_level
+
+        self.chunks = []
+        self.subjects = {}
+        self._f = open(filename, "wb")
+        self._f.write(MAGIC)
+
+    def add(self, subject, streamlines, affine=None):
+        """
+        Parameters
+        ----------
+        subject : str
+
+        streamlines : iterable of ndarray of shape (n_points, 3)
+            e.g. the output of run_tractography.
+
+        affine : ndarray of shape (4, 4), optional
+            Maps voxel indices of the subject's reference image to the
+            streamline coordinates, e.g. the affine of a .trk file loaded with
+            nibabel, whose streamlines are in RAS mm. Defaults to the identity,
+            for streamlines in voxel coordinates like those of
+            run_tractography. Used as the default ``roi_affine`` when reading.
+        """
+        if subject in self.subjects:
+            raise ValueError(f"Subject {subject} has already been added.")
+
+        streamlines = [np.asarray(s, dtype=np.float64) for s in streamlines]
+        streamlines = [s for s in streamlines if len(s)]
+
+        # Sorting by length lets length range queries skip whole chunks. The
+        # original streamline order is not kept.
+        lengths = np.array(
+            [np.linalg.norm(np.diff(s, axis=0), axis=1).sum() for s in streamlines]
+        )
+        order = np.argsort(lengths, kind="stable")
+
+        for i in range(0, len(order), self.chunk_size):
+            idx = order[i : i + self.chunk_size]
+            chunk = [streamlines[j] for j in idx]
+            self._write_chunk(subject, chunk, lengths[idx])
+
+        self.subjects[subject] = dict(
+            n_streamlines=len(streamlines),
+            affine=None if affine is None else np.asarray(affine).tolist(),
+        )
+
+    def _write_chunk(self, subject, chunk, lengths):
+        n_points = np.array([len(s) for s in chunk])
+        points = np.concatenate(chunk)
+        endpoints = np.concatenate([[s[0], s[-1]] for s in chunk])
+
+        buf, delta_dtype = _encode(
+            points, n_points, lengths, self.precision, self.compression_level
+        )
+        self.chunks.append(
+            dict(
+                subject=subject,
+                offset=self._f.tell(),
+                nbytes=len(buf),
+                n_streamlines=len(chunk),
+                n_points=int(n_points.sum()),
+                delta_dtype=delta_dtype,
+                min_length=float(lengths.min()),
+                max_length=float(lengths.max()),
+                endpoint_min=endpoints.min(axis=0).tolist(),
+                endpoint_max=endpoints.max(axis=0).tolist(),
+            )
+        )
+        self._f.write(buf)
+
+    def close(self):
+        if self._f.closed:
+            return
+
+        index = dict(
+            version=1,
+            precision=self.precision,
+            subjects=self.subjects,
+            chunks=self.chunks,
+        )
+        index_offset = self._f.tell()
+        self._f.write(json.dumps(index).encode("utf-8"))
+        self._f.write(_FOOTER.pack(index_offset))
+        self._f.write(MAGIC)
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+            return
+
+        # Do not leave a file that looks complete but is missing subjects
+        self._f.close()
+        os.remove(self.filename)
+
+
+class TractogramReader:
+    """
+    Reads files written by TractogramWriter, one chunk at a time.
+
+    Parameters
+    ----------
+    filename : str
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._f = open(filename, "rb")
+
+        if self._f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{filename} is not a compact tractogram file.")
+
+        footer_size = _FOOTER.size + len(MAGIC)
+        self._f.seek(-footer_size, 2)
+        footer = self._f.read(footer_size)
+        if footer[_FOOTER.size :] != MAGIC:
+            raise ValueError(f"{filename} is truncated.")
+        (index_offset,) = _FOOTER.unpack(footer[: _FOOTER.size])
+
+        self._f.seek(index_offset)
+        index = json.loads(self._f.read()[:-footer_size].decode("utf-8"))
+        self.precision = index["precision"]
+        self.subjects = index["subjects"]
+        self.chunks = index["chunks"]
+
+    def _roi_affine(self, chunk, roi_affine):
+        if roi_affine is not None:
+            return roi_affine
+        return self.subjects[chunk["subject"]]["affine"]
+
+    def _select_chunks(self, subjects, length_range, roi, roi_affine):
+        for chunk in self.chunks:
+            if subjects is not None and chunk["subject"] not in subjects:
+                continue
+            if length_range is not None:
+                lo, hi = length_range
+                if chunk["max_length"] < lo or chunk["min_length"] > hi:
+                    continue
+            if roi is not None:
+                bbox = np.array([chunk["endpoint_min"], chunk["endpoint_max"]])
+                corners = np.array(np.meshgrid(*bbox.T)).reshape(3, -1).T
+                vox = _to_voxels(corners, self._roi_affine(chunk, roi_affine))
+                lo = np.clip(vox.min(axis=0), 0, roi.shape)
+                hi = np.clip(vox.max(axis=0) + 1, 0, roi.shape)
+                if not roi[lo[0] : hi[0], lo[1] : hi[1], lo[2] : hi[2]].any():
+                    continue
+            yield chunk
+
+    def iter_chunks(self, subjects=None, length_range=None, roi=None, roi_affine=None):
+        """
+        Yields the streamlines matching all the given filters, one chunk at a time.
+
+        Chunks that cannot contain a match are skipped without being read.
+
+        Parameters
+        ----------
+        subjects : list of str, optional
+
+        length_range : tuple of (float, float), optional
+            Inclusive range of streamline arc lengths.
+
+        roi : ndarray of bool, optional
+            Keeps streamlines with at least one endpoint in the mask.
+
+        roi_affine : ndarray of shape (4, 4), optional
+            Maps ``roi`` voxel indices to streamline coordinates. Defaults to
+            the affine stored with each subject, i.e. ``roi`` is taken to be in
+            the voxel grid of the subject's reference image.
+
+        Yields
+        ------
+        subject : str
+
+        points : ndarray of float32, shape (n_points, 3)
+            Concatenated points of the streamlines.
+
+        n_points : ndarray of int
+            Number of points of each streamline.
+        """
+        if subjects is not None:
+            subjects = set(subjects)
+        if roi is not None:
+            roi = np.asarray(roi, dtype=bool)
+
+        for chunk in self._select_chunks(subjects, length_range, roi, roi_affine):
+            self._f.seek(chunk["offset"])
+            points, n_points, lengths = _decode(
+                self._f.read(chunk["nbytes"]),
+                chunk["n_streamlines"],
+                chunk["n_points"],
+                chunk["delta_dtype"],
+                self.precision,
+            )
+
+            keep = np.ones(len(n_points), dtype=bool)
+            if length_range is not None:
+                keep &= (lengths >= length_range[0]) & (lengths <= length_range[1])
+            if roi is not None:
+                affine = self._roi_affine(chunk, roi_affine)
+                ends = np.cumsum(n_points)
+                keep &= _in_roi(points[ends - n_points], roi, affine) | _in_roi(
+                    points[ends - 1], roi, affine
+                )
+
+            if not keep.any():
+                continue
+            if not keep.all():
+                points = points[np.repeat(keep, n_points)]
+                n_points = n_points[keep]
+
+            yield chunk["subject"], points, n_points
+
+    def load(self, subject=None, **kwargs):
+        """
+        Reads the matching streamlines into memory.
+
+        Takes the same filters as iter_chunks, ``subject`` being a shorthand
+        for ``subjects=[subject]``.
+
+        Returns
+        -------
+        ArraySequence
+        """
+        if subject is not None:
+            kwargs["subjects"] = [subject]
+
+        streamlines = []
+        for _, points, n_points in self.iter_chunks(**kwargs):
+            streamlines.extend(np.split(points, np.cumsum(n_points)[:-1]))
+        return ArraySequence(streamlines)
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _to_voxels(coords, roi_affine):
+    if roi_affine is not None:
+        inv = np.linalg.inv(roi_affine)
+        coords = coords @ inv[:3, :3].T + inv[:3, 3]
+    return np.round(coords).astype(np.intp)
+
+
+def _in_roi(coords, roi, roi_affine):
+    vox = _to_voxels(coords, roi_affine)
+    inside = np.all((vox >= 0) & (vox < roi.shape), axis=1)
+    hit = np.zeros(len(vox), dtype=bool)
+    hit[inside] = roi[tuple(vox[inside].T)]
+    return hit
@@ -0,0 +1,137 @@
+import tempfile
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+
+from hcp_connectomes.tractogram import TractogramReader, TractogramWriter
+
+
+def random_walk_streamlines(n_streamlines, rng, step_size=0.5):
+    """Streamlines with run_tractography-like step size and lengths."""
+    streamlines = []
+    for _ in range(n_streamlines):
+        n_points = rng.integers(61, 400)
+        steps = rng.normal(size=(n_points, 3))
+        # Smooth the directions so the walk looks like a fiber
+        steps = np.cumsum(steps, axis=0)
+        steps *= step_size / np.linalg.norm(steps, axis=1, keepdims=True)
+        start = rng.uniform(20, 160, size=3)
+        streamlines.append(start + np.cumsum(steps, axis=0))
+    return streamlines
+
+
+def timeit(func):
+    start = time.perf_counter()
+    out = func()
+    return out, time.perf_counter() - start
+
+
+def main(trk_files, n_subjects, n_streamlines, precision, chunk_size):
+    rng = np.random.default_rng(0)
+    if trk_files:
+        subjects = {
+            Path(f).stem.split("_")[0]: nib.streamlines.load(f).streamlines
+            for f in trk_files
+        }
+    else:
+        subjects = {
+            str(i): random_walk_streamlines(n_streamlines, rng)
+            for i in range(n_subjects)
+        }
+    n_total = sum(len(s) for s in subjects.values())
+    n_points = sum(len(x) for s in subjects.values() for x in s)
+    print(f"{len(subjects)} subjects, {n_total} streamlines, {n_points} points\n")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        benchmark(subjects, n_points, Path(tmp_dir), precision, chunk_size)
+
+
+def benchmark(subjects, n_points, tmp_path, precision, chunk_size):
+
+    # One float32 .trk per subject
+    def write_trk():
+        for subject, streamlines in subjects.items():
+            tractogram = nib.streamlines.Tractogram(
+                streamlines, affine_to_rasmm=np.eye(4)
+            )
+            nib.streamlines.save(tractogram, str(tmp_path / f"{subject}.trk"))
+
+    def read_trk():
+        return [
+            nib.streamlines.load(str(tmp_path / f"{subject}.trk")).streamlines
+            for subject in subjects
+        ]
+
+    compact_file = tmp_path / "cohort.htrk"
+
+    def write_compact():
+        with TractogramWriter(compact_file, precision, chunk_size) as writer:
+            for subject, streamlines in subjects.items():
+                writer.add(subject, streamlines)
+
+    def read_compact(**kwargs):
+        with TractogramReader(compact_file) as reader:
+            return [p for _, p, _ in reader.iter_chunks(**kwargs)]
+
+    _, trk_write = timeit(write_trk)
+    _, trk_read = timeit(read_trk)
+    trk_size = sum(f.stat().st_size for f in tmp_path.glob("*.trk"))
+
+    _, compact_write = timeit(write_compact)
+    _, compact_read = timeit(read_compact)
+    compact_size = compact_file.stat().st_size
+
+    lengths = [
+        np.linalg.norm(np.diff(x, axis=0), axis=1).sum()
+        for s in subjects.values()
+        for x in s
+    ]
+    length_range = tuple(np.percentile(lengths, [45, 55]))
+    subset, subset_read = timeit(lambda: read_compact(length_range=length_range))
+    n_subset = sum(len(p) for p in subset)
+
+    print(
+        f"{'format':<12}{'size [MB]':>12}{'write [s]':>12}"
+        f"{'read [s]':>12}{'read [Mpts/s]':>16}"
+    )
+    for name, size, write, read in [
+        (".trk", trk_size, trk_write, trk_read),
+        ("compact", compact_size, compact_write, compact_read),
+    ]:
+        print(
+            f"{name:<12}{size / 1e6:>12.1f}{write:>12.2f}{read:>12.2f}"
+            f"{n_points / read / 1e6:>16.1f}"
+        )
+    print(f"\nCompression ratio vs .trk: {trk_size / compact_size:.1f}x")
+    print(
+        f"Length range subset ({n_subset / n_points:.0%} of points): "
+        f"{subset_read:.2f} s compact vs {trk_read:.2f} s full .trk read"
+    )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        description="Compares the compact tractogram store with .trk files."
+    )
+    parser.add_argument(
+        "trk_files",
+        nargs="*",
+        help="Tractograms to benchmark with. Defaults to synthetic streamlines.",
+    )
+    parser.add_argument("--n_subjects", type=int, default=4)
+    parser.add_argument("--n_streamlines", type=int, default=20000)
+    parser.add_argument("--precision", type=float, default=0.01)
+    parser.add_argument("--chunk_size", type=int, default=2000)
+
+    result = parser.parse_args()
+
+    main(
+        result.trk_files,
+        result.n_subjects,
+        result.n_streamlines,
+        result.precision,
+        result.chunk_size,
+    )
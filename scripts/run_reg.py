@@ -1,213 +1,6 @@
-import os
-from pathlib import Path
 from argparse import ArgumentParser
 
-import nibabel as nib
-from ndmg.utils import reg_utils as mgru
-
-import warnings
-
-with warnings.catch_warnings():
-    warnings.filterwarnings("ignore", category=DeprecationWarning)
-    import sklearn
-
-
-def match_target_vox_res(img_file, vox_size="1mm", sens="t1w"):
-    """Reslices input MRI file if it does not match the targeted voxel resolution. Can take dwi or t1w scans.
-    
-    Parameters
-    ----------
-    img_file : str
-        path to file to be resliced
-    vox_size : str
-        target voxel resolution ('2mm' or '1mm')
-    namer : name_resource
-        name_resource variable containing relevant directory tree information
-    sens : str
-        type of data being analyzed ('dwi' or 'func')
-    
-    Returns
-    -------
-    str
-        location of potentially resliced image
-    """
-    from dipy.align.reslice import reslice
-
-    # Check dimensions
-    img = nib.load(img_file)
-    data = img.get_fdata()
-    affine = img.affine
-    hdr = img.header
-    zooms = hdr.get_zooms()[:3]
-    if vox_size == "1mm":
-        new_zooms = (1.0, 1.0, 1.0)
-    elif vox_size == "2mm":
-        new_zooms = (2.0, 2.0, 2.0)
-
-    if (abs(zooms[0]), abs(zooms[1]), abs(zooms[2])) != new_zooms:
-        # print("Reslicing image " + img_file + " to " + vox_size + "...")
-
-        data2, affine2 = reslice(data, affine, zooms, new_zooms)
-        img2 = nib.Nifti1Image(data2, affine=affine2)
-        nib.save(img2, img_file)
-    else:
-        nib.save(img, img_file)
-
-
-def register_t1w_2_mni(
-    input_path,
-    output_path,
-    subject,
-    ses=1,
-    nonlinear=False,
-    vox_size="1mm",
-    normalize=True,
-):
-    """
-    Parameters
-    ----------
-    input_path : str
-        directory to bids
-    output_path : str
-        output bids
-    """
-    # deal with paths
-    input_path = Path(input_path)
-    output_path = Path(output_path) / f"sub-{subject}"
-
-    if not (input_path / f"sub-{subject}").is_dir():
-        return
-
-    if not output_path.is_dir():
-        output_path.mkdir(parents=True)
-
-    mask_path = output_path / "masks"
-    if not mask_path.is_dir():
-        mask_path.mkdir(parents=True)
-
-    FSLDIR = os.environ["FSLDIR"]
-
-    # files names
-    input_t1w = (
-        input_path
-        / f"sub-{subject}"
-        / f"ses-{ses}"
-        / "anat"
-        / f"sub-{subject}_ses-{ses}_T1w.nii.gz"
-    )
-    input_mni = "%s%s%s%s" % (
-        FSLDIR,
-        "/data/standard/MNI152_T1_",
-        vox_size,
-        "_brain.nii.gz",
-    )
-    input_mni_mask = "%s%s%s%s" % (
-        FSLDIR,
-        "/data/standard/MNI152_T1_",
-        vox_size,
-        "_brain_mask.nii.gz",
-    )
-    input_mni_sched = "%s%s" % (FSLDIR, "/etc/flirtsch/T1_2_MNI152_2mm.cnf")
-
-    t1w_brain = output_path / f"sub-{subject}_ses-{ses}_T1w_brain.nii.gz"
-    t1w_normalized = output_path / f"sub-{subject}_ses-{ses}_T1w_normalized.nii.gz"
-    t1w_brain_aligned = (
-        output_path / f"sub-{subject}_ses-{ses}_T1w_brain_aligned.nii.gz"
-    )
-    t12mni_xfm_init = output_path / f"sub-{subject}_ses-{ses}_t12mni_xfm_init.mat"
-    t12mni_xfm = output_path / f"sub-{subject}_ses-{ses}_t12mni_xfm.mat"
-    warp_t1w2mni = output_path / f"sub-{subject}_ses-{ses}_warp-t1w2mni.mat"
-
-    if normalize:
-        # Normalize
-        print("\nRunning Normalization")
-        mgru.normalize_t1w(input_t1w, t1w_normalized)
-    else:
-        t1w_normalized = input_t1w
-
-    # Skull stripping
-    print("\nRunning 3dSkullStrip")
-    mgru.t1w_skullstrip(t1w_normalized, str(t1w_brain))
-
-    # Voxel reshape
-    print("\nRunning Voxel Matching")
-    match_target_vox_res(str(t1w_brain))
-
-    # Create linear transform/ initializer T1w-->MNI
-    print("\nInitial T1w->MNI transform")
-    mgru.align(
-        t1w_brain,
-        input_mni,
-        xfm=t12mni_xfm_init,
-        bins=None,
-        interp="spline",
-        out=None,
-        dof=12,
-        cost="mutualinfo",
-        searchrad=True,
-    )
-
-    # Registration from t1w -> MNI
-    if nonlinear:
-        print("\nRunning non-linear registration: T1w-->MNI ...")
-        # Use FNIRT to nonlinearly align T1 to MNI template
-        mgru.align_nonlinear(
-            t1w_brain,
-            input_mni,
-            xfm=t12mni_xfm_init,
-            out=t1w_brain_aligned,
-            warp=warp_t1w2mni,
-            ref_mask=input_mni_mask,
-            config=input_mni_sched,
-        )
-    else:
-        # Falling back to linear registration
-        print("\nRunning linear registration: T1w-->MNI ...")
-        mgru.align(
-            t1w_brain,
-            input_mni,
-            xfm=t12mni_xfm,
-            init=t12mni_xfm_init,
-            bins=None,
-            dof=12,
-            cost="mutualinfo",
-            searchrad=True,
-            interp="spline",
-            out=t1w_brain_aligned,
-            sch=None,
-        )
-
-    # Segment wm, gm, csf
-    print("\nSegmenting brain regions")
-    maps = mgru.segment_t1w(t1w_brain, mask_path / f"sub-{subject}")
-
-    wm_mask = maps["wm_prob"]
-    gm_mask = maps["gm_prob"]
-    csf_mask = maps["csf_prob"]
-    tissue_mask = str(mask_path / f"sub-{subject}_pveseg.nii.gz")
-    match_target_vox_res(wm_mask)
-    match_target_vox_res(gm_mask)
-    match_target_vox_res(csf_mask)
-    match_target_vox_res(tissue_mask)
-
-    # Apply xfm to masks
-    wm_mask_aligned = mask_path / f"sub-{subject}_wm_mask.nii.gz"
-    gm_mask_aligned = mask_path / f"sub-{subject}_gm_mask.nii.gz"
-    csf_mask_aligned = mask_path / f"sub-{subject}_csf_mask.nii.gz"
-    tissue_mask_aligned = mask_path / f"sub-{subject}_tissue_mask.nii.gz"
-
-    print("\nApplying T1w-->MNI warp to masks")
-    mgru.applyxfm(t1w_brain_aligned, wm_mask, t12mni_xfm, wm_mask_aligned)
-    mgru.applyxfm(t1w_brain_aligned, gm_mask, t12mni_xfm, gm_mask_aligned)
-    mgru.applyxfm(t1w_brain_aligned, csf_mask, t12mni_xfm, csf_mask_aligned)
-    mgru.applyxfm(t1w_brain_aligned, tissue_mask, t12mni_xfm, tissue_mask_aligned)
-
-    # remove unnecessary files
-    [
-        os.remove(str(x))
-        for x in list(mask_path.glob("*.nii.gz"))
-        if not "mask" in str(x.name)
-    ]
+from hcp_connectomes.register import register_t1w_2_mni
 
 
 def main():
@@ -260,6 +53,11 @@ def main():
     parser.add_argument(
         "--normalize", default=True, help="Whether to use T1w normalization"
     )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Rerun every step, even if its outputs are up to date",
+    )
 
     result = parser.parse_args()
 
@@ -270,8 +68,9 @@ def main():
     nonlinear = result.nonlinear
     vox = result.vox
     normalize = result.normalize
+    force = result.force
 
-    register_t1w_2_mni(inDir, outDir, subj, sesh, nonlinear, vox, normalize)
+    register_t1w_2_mni(inDir, outDir, subj, sesh, nonlinear, vox, normalize, force)
 
 
 if __name__ == "__main__":
@@ -7,6 +7,8 @@ REQUIRED_PACKAGES = [
     "scipy>=1.4.0",
     "nibabel",
     "boto3",
+    "joblib",
+    "pandas",
 ]
 
 setup(
@@ -17,4 +19,5 @@ setup(
     author="j1c",
     license="Apache License 2.0",
     install_requires=REQUIRED_PACKAGES,
+    entry_points={"console_scripts": ["hcp-connectomes=hcp_connectomes.cli:main"]},
 )
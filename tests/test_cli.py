@@ -0,0 +1,73 @@
+import pytest
+
+from hcp_connectomes.cli import (
+    get_parser,
+    main,
+    measure_import_time,
+    parse_import_time,
+)
+
+IMPORTTIME = """\
+import time: self [us] | cumulative | imported package
+import time:       100 |        100 |   _io
+import time:       200 |        300 | io
+import time:        50 |         50 | hcp_connectomes
+import time:       400 |        400 |   argparse
+import time:       300 |        300 |     hcp_connectomes.cli
+import time:        10 |        710 | hcp_connectomes.cli
+"""
+
+
+def test_help(capsys):
+    with pytest.raises(SystemExit) as e:
+        main(["--help"])
+    assert e.value.code == 0
+    assert "import-time" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize(
+    "argv",
+    [
+        ["download", "out"],
+        ["register", "in", "out", "100206", "100307", "--nonlinear", "true"],
+        ["volumes", "in", "out", "parcellations"],
+        ["track", "dwi", "bval", "bvec", "wmparc", "out.trk", "--mod_type", "prob"],
+        ["pipeline", "scratch", "out", "--max_staged", "3"],
+        ["pack", "cohort.htrk", "100206_tracks.trk"],
+        ["import-time", "--max_seconds", "0.5"],
+    ],
+)
+def test_subcommands_parse(argv):
+    args = get_parser().parse_args(argv)
+    assert args.command == argv[0]
+    assert callable(args.func)
+
+
+def test_parse_import_time():
+    total, imports = parse_import_time(IMPORTTIME, "hcp_connectomes.cli")
+
+    # Only the top-level hcp_connectomes and hcp_connectomes.cli lines count
+    assert total == 50 + 710
+    assert imports[0] == (100, 100, "_io")
+    assert len(imports) == 6
+
+
+def test_cli_imports_fast():
+    total, imports = measure_import_time("hcp_connectomes.cli")
+    names = {name for _, _, name in imports}
+
+    assert total > 0
+    assert "hcp_connectomes.cli" in names
+    # Heavy dependencies are only imported when a subcommand runs
+    assert not names & {"dipy", "nipype", "ndmg", "boto3", "nibabel", "numpy"}
+
+
+def test_import_time_budget(capsys):
+    with pytest.raises(SystemExit) as e:
+        main(["import-time", "no_such_module", "json", "--max_seconds", "10"])
+    assert e.value.code == 1
+
+    out = capsys.readouterr().out
+    # Modules after the failing one are still reported
+    assert "json:" in out
+    assert "no_such_module" in out.splitlines()[-1]
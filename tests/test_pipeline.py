@@ -0,0 +1,121 @@
+import time
+from pathlib import Path
+
+import pytest
+
+from hcp_connectomes.pipeline import run_pipeline
+
+FILES = ["T1w/wmparc.nii.gz", "T1w/Diffusion/data.nii.gz", "T1w/Diffusion/bvals"]
+
+
+class FakeS3:
+    """Local stand-in for the boto3 S3 client used by the download module."""
+
+    def __init__(self, subjects, listed=(), broken=()):
+        self.keys = [f"HCP_1200/{s}/{f}" for s in subjects for f in FILES]
+        self.listed = list(subjects) + list(listed)
+        self.broken = broken
+
+    def list_objects_v2(self, **kwargs):
+        prefixes = [{"Prefix": f"HCP_1200/{s}/"} for s in self.listed]
+        return {"CommonPrefixes": prefixes}
+
+    def list_objects(self, Bucket, Prefix, Delimiter=None):
+        contents = [{"Key": k} for k in self.keys if k.startswith(Prefix)]
+        return {"Contents": contents} if contents else {}
+
+    def download_file(self, Bucket, Key, Filename):
+        if Key.split("/")[1] in self.broken:
+            raise ConnectionError("connection reset")
+        time.sleep(0.01)
+        Path(Filename).write_text("data")
+
+
+def test_pipeline(tmp_path):
+    scratch = tmp_path / "scratch"
+    s3 = FakeS3(["100", "101", "102", "103"], listed=["999"], broken=["101"])
+
+    staged = []
+
+    def register(subject, subject_path):
+        assert (subject_path / FILES[0]).exists()
+        staged.append(len(list(scratch.iterdir())))
+        time.sleep(0.05)
+
+    def track(subject, subject_path):
+        if subject == "102":
+            raise RuntimeError("tracking failed")
+
+    report = run_pipeline(
+        None,
+        None,
+        scratch,
+        [("register", register), ("track", track)],
+        s3=s3,
+        max_staged=2,
+    )
+
+    assert report["subjects"] == {
+        "100": "done",
+        "101": "failed",
+        "102": "failed",
+        "103": "done",
+        "999": "missing",
+    }
+    assert max(staged) <= 2
+    assert list(scratch.iterdir()) == []
+
+    download, register_stats, track_stats = report["stages"]
+    assert download["n_failed"] == 1
+    assert register_stats["n_subjects"] == 3
+    assert track_stats["n_failed"] == 1
+
+
+def test_pipeline_keep_inputs(tmp_path):
+    s3 = FakeS3(["100", "101"])
+    report = run_pipeline(
+        None, None, tmp_path, [("noop", lambda *args: None)], s3=s3, evict=False
+    )
+
+    assert report["subjects"] == {"100": "done", "101": "done"}
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["100", "101"]
+
+
+def test_pipeline_stage_exit(tmp_path):
+    def stage(subject, subject_path):
+        raise SystemExit(1)
+
+    with pytest.raises(SystemExit):
+        run_pipeline(None, None, tmp_path, [("exit", stage)], s3=FakeS3(["100"]))
+
+
+def test_pipeline_stage_exit_stops_and_evicts(tmp_path):
+    scratch = tmp_path / "scratch"
+    s3 = FakeS3(["100", "101", "102", "103", "104"])
+    running = []
+    registered = []
+
+    def register(subject, subject_path):
+        running.append(subject)
+        time.sleep(0.05)
+        registered.append(subject)
+        running.remove(subject)
+
+    def track(subject, subject_path):
+        raise SystemExit(1)
+
+    with pytest.raises(SystemExit):
+        run_pipeline(
+            None,
+            None,
+            scratch,
+            [("register", register), ("track", track)],
+            s3=s3,
+            max_staged=2,
+        )
+
+    # No stage is still running and nothing is left on the scratch disk
+    assert running == []
+    assert list(scratch.iterdir()) == []
+    # Subjects staged after the error are not processed
+    assert len(registered) < 5
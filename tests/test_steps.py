@@ -0,0 +1,143 @@
+import os
+
+import pytest
+
+from hcp_connectomes.steps import StepRunner
+
+
+def touch(path, mtime=None):
+    path.write_text("x")
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+class Pipeline:
+    """in -> a -> mid -> b -> out, with mid removed by cleanup."""
+
+    def __init__(self, tmp_path):
+        self.tmp_path = tmp_path
+        self.src = tmp_path / "in"
+        self.mid = tmp_path / "mid"
+        self.out = tmp_path / "out"
+        self.calls = []
+        touch(self.src, mtime=1000)
+
+    def run(self, b_params=None, fail_b=False, force=False):
+        runner = StepRunner(self.tmp_path / "steps.json", force, verbose=False)
+
+        def a():
+            self.calls.append("a")
+            touch(self.mid)
+
+        def b():
+            self.calls.append("b")
+            assert self.mid.exists()
+            if not fail_b:
+                touch(self.out)
+
+        runner.run("a", a, inputs=[self.src], outputs=[self.mid])
+        runner.run("b", b, inputs=[self.mid], outputs=[self.out], params=b_params)
+        runner.cleanup([self.mid])
+        return runner
+
+
+def test_skip(tmp_path):
+    p = Pipeline(tmp_path)
+    p.run()
+    runner = p.run()
+
+    assert p.calls == ["a", "b"]
+    assert [ran for _, _, ran in runner.timings] == [False, False]
+
+
+def test_rerun_on_newer_input(tmp_path):
+    p = Pipeline(tmp_path)
+    p.run()
+    touch(p.src)
+    p.run()
+
+    assert p.calls == ["a", "b", "a", "b"]
+
+
+def test_rerun_on_param_change(tmp_path):
+    p = Pipeline(tmp_path)
+    p.run(b_params=dict(vox_size="1mm"))
+    p.run(b_params=dict(vox_size="1mm"))
+    assert p.calls == ["a", "b"]
+
+    # b needs mid, which was removed, so a reruns first
+    p.run(b_params=dict(vox_size="2mm"))
+    assert p.calls == ["a", "b", "a", "b"]
+    assert not p.mid.exists()
+
+
+def test_force(tmp_path):
+    p = Pipeline(tmp_path)
+    p.run()
+    p.run(force=True)
+
+    assert p.calls == ["a", "b", "a", "b"]
+
+
+def test_missing_output_raises(tmp_path):
+    p = Pipeline(tmp_path)
+    with pytest.raises(RuntimeError, match="did not produce"):
+        p.run(fail_b=True)
+
+    # The failed step is not recorded, so the next run resumes at it
+    p.run()
+    assert p.calls == ["a", "b", "b"]
+
+
+def test_cleanup_then_downstream_rerun(tmp_path):
+    # in -> a -> mid -> b -> out, where b also reads a file that changes
+    src, mid, other, out = [tmp_path / x for x in ["in", "mid", "other", "out"]]
+    touch(src, mtime=1000)
+    touch(other, mtime=1000)
+    calls = []
+
+    def a():
+        calls.append("a")
+        touch(mid)
+
+    def b():
+        calls.append("b")
+        # e.g. flirt failing on a removed FAST output
+        assert mid.exists()
+        touch(out)
+
+    def run():
+        runner = StepRunner(tmp_path / "steps.json", verbose=False)
+        runner.run("a", a, inputs=[src], outputs=[mid])
+        runner.run("b", b, inputs=[mid, other], outputs=[out])
+        runner.cleanup([mid])
+
+    run()
+    assert calls == ["a", "b"]
+
+    # a is up to date, but b has to rerun and needs the removed mid
+    touch(other)
+    run()
+    assert calls == ["a", "b", "a", "b"]
+    assert not mid.exists()
+
+
+def test_silent_failure_with_stale_output(tmp_path):
+    src, out = tmp_path / "in", tmp_path / "out"
+    touch(src, mtime=1000)
+
+    def run(func, vox_size):
+        runner = StepRunner(tmp_path / "steps.json", verbose=False)
+        runner.run(
+            "a", func, inputs=[src], outputs=[out], params=dict(vox_size=vox_size)
+        )
+        return runner
+
+    run(lambda: touch(out), "1mm")
+
+    # e.g. an FSL command failing on a missing 2mm template without raising
+    with pytest.raises(RuntimeError, match="did not produce"):
+        run(lambda: None, "2mm")
+
+    runner = StepRunner(tmp_path / "steps.json", verbose=False)
+    assert "a" not in runner.state["steps"]
@@ -0,0 +1,108 @@
+import nibabel as nib
+import numpy as np
+import pytest
+
+from hcp_connectomes.cli import main
+from hcp_connectomes.tractogram import TractogramReader, TractogramWriter
+
+
+def random_walks(n_streamlines, rng, start=50):
+    streamlines = []
+    for _ in range(n_streamlines):
+        steps = rng.normal(size=(rng.integers(61, 200), 3))
+        steps *= 0.5 / np.linalg.norm(steps, axis=1, keepdims=True)
+        streamlines.append(start + rng.uniform(0, 20, 3) + np.cumsum(steps, axis=0))
+    return streamlines
+
+
+def arc_length(s):
+    return np.linalg.norm(np.diff(s, axis=0), axis=1).sum()
+
+
+@pytest.fixture
+def cohort():
+    rng = np.random.default_rng(0)
+    return {"100206": random_walks(300, rng), "100307": random_walks(200, rng)}
+
+
+def test_round_trip(tmp_path, cohort):
+    filename = tmp_path / "cohort.htrk"
+    with TractogramWriter(filename, precision=0.01, chunk_size=64) as writer:
+        for subject, streamlines in cohort.items():
+            writer.add(subject, streamlines)
+
+    with TractogramReader(filename) as reader:
+        assert set(reader.subjects) == set(cohort)
+
+        loaded = reader.load("100307")
+        expected = sorted(cohort["100307"], key=arc_length)
+        assert len(loaded) == len(expected)
+        for a, b in zip(loaded, expected):
+            assert np.abs(a - b).max() <= 0.005 + 1e-4
+
+        lo, hi = 40.2, 60.2
+        subset = reader.load(length_range=(lo, hi))
+        n_expected = sum(
+            lo <= arc_length(s) <= hi for v in cohort.values() for s in v
+        )
+        assert len(subset) == n_expected
+        # Whole chunks outside the range are skipped
+        selected = list(reader._select_chunks(None, (lo, hi), None, None))
+        assert len(selected) < len(reader.chunks)
+
+
+def test_roi_uses_stored_affine(tmp_path, cohort):
+    # Streamlines in mm of a 2 mm voxel grid
+    affine = np.diag([2.0, 2.0, 2.0, 1.0])
+    roi = np.zeros((100, 100, 100), dtype=bool)
+    roi[25:32, 25:32, 25:32] = True
+
+    def in_roi(point):
+        return roi[tuple(np.round(point / 2).astype(int))]
+
+    filename = tmp_path / "cohort.htrk"
+    with TractogramWriter(filename) as writer:
+        writer.add("100206", cohort["100206"], affine)
+
+    with TractogramReader(filename) as reader:
+        loaded = reader.load(roi=roi)
+
+    n_expected = sum(in_roi(s[0]) or in_roi(s[-1]) for s in cohort["100206"])
+    assert n_expected > 0
+    assert len(loaded) == n_expected
+
+
+def test_failed_write_leaves_no_file(tmp_path, cohort):
+    filename = tmp_path / "cohort.htrk"
+    with pytest.raises(RuntimeError):
+        with TractogramWriter(filename) as writer:
+            writer.add("100206", cohort["100206"])
+            raise RuntimeError("interrupted")
+
+    assert not filename.exists()
+
+
+def test_truncated_file(tmp_path, cohort):
+    filename = tmp_path / "cohort.htrk"
+    with TractogramWriter(filename) as writer:
+        writer.add("100206", cohort["100206"])
+
+    data = filename.read_bytes()
+    filename.write_bytes(data[: len(data) // 2])
+    with pytest.raises(ValueError, match="truncated"):
+        TractogramReader(filename)
+
+
+def test_pack(tmp_path, cohort):
+    for name, subject in [("100206.trk", "100206"), ("100307_tracks.trk", "100307")]:
+        tractogram = nib.streamlines.Tractogram(
+            cohort[subject], affine_to_rasmm=np.eye(4)
+        )
+        nib.streamlines.save(tractogram, str(tmp_path / name))
+
+    filename = tmp_path / "cohort.htrk"
+    main(["pack", str(filename)] + [str(f) for f in sorted(tmp_path.glob("*.trk"))])
+
+    with TractogramReader(filename) as reader:
+        assert sorted(reader.subjects) == ["100206", "100307"]
+        assert len(reader.load("100206")) == len(cohort["100206"])